@@ -0,0 +1,142 @@
+"""Request/response models shared by the Authzed client implementations."""
+
+from dataclasses import dataclass, field
+from enum import Enum
+
+
+class Access(Enum):
+    """Outcome of a permission check."""
+
+    allow = "allow"
+    forbid = "forbid"
+
+    def is_allowed(self) -> bool:
+        return self is Access.allow
+
+
+class RelationUpdateType(Enum):
+    grant = "grant"
+    revoke = "revoke"
+
+
+# Plain stdlib dataclasses, deliberately not pydantic: construction is a
+# straight __init__ plus a cheap __post_init__ str() coercion for ids, with
+# no per-instance schema validation - check_many builds thousands of these.
+# The request models are frozen with __slots__: they are used as dict keys
+# throughout (decision cache, batch dedup, result maps), so they get a hash
+# precomputed once at construction instead of re-hashing five strings per
+# lookup, and slots drop the per-instance __dict__ - which matters for
+# check_many batches of thousands of requests.
+
+
+@dataclass(frozen=True, slots=True)
+class CheckRequest:
+    """A single permission check: may ``subject`` do ``permission`` on ``resource``?"""
+
+    resource_type: str
+    resource_id: str | int
+    permission: str
+    subject_type: str
+    subject_id: str | int
+    _h: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # ``__class__ is int`` skips isinstance's MRO walk; ids arrive as
+        # str in the common case and are left untouched.
+        if self.resource_id.__class__ is int:
+            object.__setattr__(self, "resource_id", str(self.resource_id))
+        if self.subject_id.__class__ is int:
+            object.__setattr__(self, "subject_id", str(self.subject_id))
+        object.__setattr__(
+            self,
+            "_h",
+            hash(
+                (
+                    self.resource_type,
+                    self.resource_id,
+                    self.permission,
+                    self.subject_type,
+                    self.subject_id,
+                )
+            ),
+        )
+
+    def __hash__(self) -> int:
+        return self._h
+
+
+@dataclass(frozen=True, slots=True)
+class ResourcesRequest:
+    """A resource lookup: which resources may ``subject`` act on with ``permission``?"""
+
+    resource_type: str
+    permission: str
+    subject_type: str
+    subject_id: str | int
+    _h: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.subject_id.__class__ is int:
+            object.__setattr__(self, "subject_id", str(self.subject_id))
+        object.__setattr__(
+            self,
+            "_h",
+            hash((self.resource_type, self.permission, self.subject_type, self.subject_id)),
+        )
+
+    def __hash__(self) -> int:
+        return self._h
+
+
+@dataclass(frozen=True, slots=True)
+class RelationUpdateRequest:
+    """A single relationship write (grant or revoke)."""
+
+    update_type: RelationUpdateType
+    resource_type: str
+    resource_id: str | int
+    relation: str
+    subject_type: str
+    subject_id: str | int
+    subject_relation: str = ""
+    _h: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.resource_id.__class__ is int:
+            object.__setattr__(self, "resource_id", str(self.resource_id))
+        if self.subject_id.__class__ is int:
+            object.__setattr__(self, "subject_id", str(self.subject_id))
+        object.__setattr__(
+            self,
+            "_h",
+            hash(
+                (
+                    self.update_type,
+                    self.resource_type,
+                    self.resource_id,
+                    self.relation,
+                    self.subject_type,
+                    self.subject_id,
+                    self.subject_relation,
+                )
+            ),
+        )
+
+    def __hash__(self) -> int:
+        return self._h
+
+
+@dataclass(frozen=True, slots=True)
+class ResourcesWithRelations:
+    """A resource together with every relation the subject holds on it."""
+
+    resource_id: str
+    relations: tuple[str, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class SubjectsWithRelations:
+    """A subject together with every relation it holds on the resource."""
+
+    subject_id: str
+    relations: tuple[str, ...]